@@ -1,153 +1,461 @@
+import argparse
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import selectors
 import socket
+import struct
 import threading
 import time
-import sys
+
+try:
+    # C-level reentrant lock, much cheaper than threading's when uncontended
+    from fastrlock.rlock import FastRLock as RLock
+except ImportError:
+    from threading import RLock
+
+log = logging.getLogger(__name__)
+
+# Largest possible UDP payload; a datagram is always read whole
+MAX_DATAGRAM_SIZE = 65535
+# A neighbor silent for this many update intervals is treated as down
+NEIGHBOR_TIMEOUT_INTERVALS = 3
+# Requested kernel buffer size for update sockets; the kernel may cap it
+SOCKET_BUFFER_SIZE = 1 << 20
+# Update intervals a route lost with its next hop's link stays unreachable
+HOLD_DOWN_INTERVALS = 2
+# Minimum spacing of triggered updates, in seconds
+MIN_FLUSH_INTERVAL = 0.05
+# Every this many periodic ticks the full table is sent, otherwise deltas
+FULL_UPDATE_EVERY = 5
+# Update header (sequence, entry count, port, IPv4) and (dest, next hop, cost) entries
+UPDATE_HEADER = struct.Struct('!IHH4s')
+UPDATE_ENTRY = struct.Struct('!HHI')
+# The leading sequence number, stamped into a built update before it is sent
+UPDATE_SEQUENCE = struct.Struct('!I')
+# Cost of an unreachable route, also sent as-is on the wire
+INF = 0xFFFFFFFF
+# Server ids travel as u16 fields
+MAX_SERVER_ID = 0xFFFF
 
 class Router:
-    def __init__(self, server_id, update_interval, topology_file):
+    def __init__(self, server_id, update_interval, topology_file, listeners=1, pin_cpus=False, workers=1):
         self.server_id = server_id
         self.update_interval = update_interval
-        self.routing_table = {}
+        self.pin_cpus = pin_cpus
+        # Immutable (costs, next_hops) snapshot indexed like node_ids; rebound, never mutated
+        self.routes = ((), ())
+        # Neighbor id -> (routes snapshot, link cost, payload) of its last full update
+        self._update_cache = {}
+        # Indices of routes changed since the last send_update
+        self._changed = set()
+        # Neighbor id -> indices of routes not yet sent to it
+        self._pending = {}
         self.neighbors = {}
-        self.packet_counter = 0
+        # (ip, port) -> neighbor id, for identifying the sender of an update
+        self.neighbor_by_addr = {}
+        # Configured cost of each link, restored when a timed-out neighbor returns
+        self.link_costs = {}
+        # Neighbors whose link was disabled by command; these stay down
+        self.disabled = set()
+        # Monotonic time each neighbor was last heard from
+        self.last_heard = {}
+        # Last distance vector advertised by each neighbor, indexed like node_ids
+        self.neighbor_vectors = {}
+        # Route index -> (deadline, cost before the hold) of routes in hold-down
+        self.hold_down = {}
+        # Received datagram count; "packets" reads it relative to a moving base
+        self._packet_count = itertools.count()
+        self._packets_base = 0
+        # Sequence numbers of sent updates, seeded from the clock to survive restarts
+        self._sequence = itertools.count(int(time.time() * 1000))
+        # Sequence number of the newest update applied from each neighbor
+        self.last_sequence = {}
+        # Entries of the last update applied from each neighbor
+        self.last_entries = {}
         self.running = True
+        # Set when the routing table changed and neighbors should be told
+        self._dirty = threading.Event()
+        # Set to stop sending updates on exit
+        self._stop = threading.Event()
+        # Guards routing table changes made from worker and command threads
+        self.lock = RLock()
+        # Serializes send_update between the command and timer threads
+        self._send_lock = threading.Lock()
+        # Received messages are handed to workers so listeners only do I/O
+        self.work_queues = [queue.SimpleQueue() for _ in range(max(1, workers))]
         self.load_topology(topology_file)
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind((self.ip, self.port))
+
+        # Several listeners share the port through SO_REUSEPORT (Linux 3.9+)
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            listeners = 1
+        self.sockets = [self.open_socket(reuse_port=listeners > 1) for _ in range(listeners)]
+        self.sock = self.sockets[0]
+        # Connected UDP sockets per neighbor, reused for every update sent
+        self.neighbor_socks = {}
+
+    def open_socket(self, reuse_port=False):
+        """ Create a UDP socket bound to this server's address """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        sock.bind((self.ip, self.port))
+        return sock
+
+    def neighbor_socket(self, neighbor_id):
+        """ Return the cached socket connected to a neighbor, dialing it if needed """
+        sock = self.neighbor_socks.get(neighbor_id)
+        if sock is None:
+            info = self.neighbors[neighbor_id]
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+            sock.connect((info['ip'], info['port']))
+            # Another sender thread may have dialed the same neighbor meanwhile
+            cached = self.neighbor_socks.setdefault(neighbor_id, sock)
+            if cached is not sock:
+                sock.close()
+                sock = cached
+        return sock
+
+    def drop_neighbor_socket(self, neighbor_id):
+        """ Close a neighbor's cached socket so the next send redials it """
+        sock = self.neighbor_socks.pop(neighbor_id, None)
+        if sock is not None:
+            sock.close()
 
     def load_topology(self, topology_file):
         """ Load and initialize routing table and neighbors from topology file """
         with open(topology_file, 'r') as f:
-            lines = [line.split('#')[0].strip() for line in f if line.strip()]
-            num_servers = int(lines[0])
-            num_neighbors = int(lines[1])
-
-            # Initialize self in routing table
-            self.routing_table[self.server_id] = {'next_hop': self.server_id, 'cost': 0.0}
+            # Stream the file in one pass, skipping blank and comment-only lines
+            lines = filter(None, (line.split('#')[0].strip() for line in f))
+            num_servers = int(next(lines))
+            num_neighbors = int(next(lines))
 
             # Process server details and assign self IP/Port
-            for i in range(2, 2 + num_servers):
-                sid, sip, sport = lines[i].split()
+            servers = {}
+            for line in itertools.islice(lines, num_servers):
+                sid, sip, sport = line.split()
                 sid, sport = int(sid), int(sport)
+                if not 0 <= sid <= MAX_SERVER_ID:
+                    raise ValueError(f"server id {sid} is out of range 0-{MAX_SERVER_ID}")
+                servers[sid] = (sip, sport)
                 if sid == self.server_id:
                     self.ip = sip
                     self.port = sport
-                else:
-                    self.routing_table[sid] = {'next_hop': sid, 'cost': float('inf')}
-
-            # Process neighbors
-            for i in range(2 + num_servers, 2 + num_servers + num_neighbors):
-                sid1, sid2, cost = map(int, lines[i].split())
-                if sid1 == self.server_id:
-                    neighbor_ip, neighbor_port = None, None
-                    for line in lines[2:2 + num_servers]:
-                        sid, sip, sport = line.split()
-                        if int(sid) == sid2:
-                            neighbor_ip, neighbor_port = sip, int(sport)
-                            break
-                    if neighbor_ip and neighbor_port:
-                        self.neighbors[sid2] = {'cost': cost, 'ip': neighbor_ip, 'port': neighbor_port}
-                        self.routing_table[sid2] = {'next_hop': sid2, 'cost': cost}
+                    self.packed_ip = socket.inet_aton(sip)
+
+            # Process neighbors, resolving addresses from the parsed server list
+            for line in itertools.islice(lines, num_neighbors):
+                sid1, sid2, cost = map(int, line.split())
+                if not 0 <= cost < INF:
+                    raise ValueError(f"link {sid1} {sid2} cost {cost} is out of range 0-{INF - 1}")
+                if sid1 == self.server_id and sid2 in servers:
+                    neighbor_ip, neighbor_port = servers[sid2]
+                    self.neighbors[sid2] = {'cost': cost, 'ip': neighbor_ip, 'port': neighbor_port}
+                    self.neighbor_by_addr[(neighbor_ip, neighbor_port)] = sid2
+                    self.link_costs[sid2] = cost
+
+            # Sorted server ids: display order and id -> index mapping
+            self.node_ids = sorted(servers)
+            self.index = {sid: i for i, sid in enumerate(self.node_ids)}
+            now = time.monotonic()
+            for neighbor_id in self.neighbors:
+                self.last_heard[neighbor_id] = now
+                # Until it advertises, a neighbor is only known to reach itself
+                vector = [INF] * len(self.node_ids)
+                vector[self.index[neighbor_id]] = 0
+                self.neighbor_vectors[neighbor_id] = vector
+                self._pending[neighbor_id] = set()
+            self.recalculate_routes()
 
             # Debug output for initialization
-            print(f"Server {self.server_id} neighbors: {self.neighbors}")
-            print(f"Server {self.server_id} routing table: {self.routing_table}")
-            print(f"Server {self.server_id} IP: {self.ip}, Port: {self.port}")
-
-    def send_update(self):
-        """ Send distance vector updates to all neighbors """
-        update_message = self.create_update_message()
-        for neighbor_id, neighbor_info in self.neighbors.items():
-            neighbor_ip = neighbor_info['ip']
-            neighbor_port = neighbor_info['port']
-            self.sock.sendto(update_message.encode(), (neighbor_ip, neighbor_port))
-            print(f"Sent update to Server {neighbor_id} at {neighbor_ip}:{neighbor_port}")
-            print(f"Update content: {update_message}")
-
-    def create_update_message(self):
-        """ Create a message to send the routing table to neighbors """
-        message = f"{len(self.routing_table)} {self.port} {self.ip} "
-        for dest_id, data in self.routing_table.items():
-            message += f"{dest_id} {data['next_hop']} {data['cost']} "
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Server %s neighbors: %s", self.server_id, self.neighbors)
+                log.debug("Server %s routing table: %s", self.server_id, self.routing_table)
+                log.debug("Server %s IP: %s, Port: %s", self.server_id, self.ip, self.port)
+
+    def send_update(self, full=True, heartbeat=False):
+        """ Send the full table, or each neighbor's pending routes, to all neighbors """
+        with self._send_lock:
+            self._send_update(full, heartbeat)
+
+    def _send_update(self, full, heartbeat):
+        """ Send updates to all neighbors; caller holds the send lock """
+        with self.lock:
+            changed, self._changed = self._changed, set()
+            routes = self.routes
+            # Numbered with the snapshot so newer routes always carry a higher number
+            sequence = next(self._sequence) & 0xFFFFFFFF
+            # Disabled neighbors keep their pending routes until the link is back
+            deltas = {}
+            for neighbor_id, pending in self._pending.items():
+                pending |= changed
+                if neighbor_id not in self.disabled:
+                    deltas[neighbor_id] = pending
+                    self._pending[neighbor_id] = set()
+        for neighbor_id, delta in deltas.items():
+            if not full and not delta and not heartbeat:
+                continue
+            neighbor_info = self.neighbors[neighbor_id]
+            try:
+                if not full:
+                    payload = self.create_update_message(routes, neighbor_id, sorted(delta))
+                else:
+                    # Reuse the update built for the current snapshot
+                    cache = self._update_cache.get(neighbor_id)
+                    if cache is None or cache[0] is not routes or cache[1] != neighbor_info['cost']:
+                        cache = (routes, neighbor_info['cost'],
+                                 self.create_update_message(routes, neighbor_id))
+                        self._update_cache[neighbor_id] = cache
+                    payload = cache[2]
+                UPDATE_SEQUENCE.pack_into(payload, 0, sequence)
+            except struct.error as e:
+                # An unencodable entry must not stop the update loop
+                log.error("Failed to encode update for Server %s: %s", neighbor_id, e)
+                self.restore_pending(neighbor_id, delta)
+                continue
+            try:
+                self.neighbor_socket(neighbor_id).send(payload)
+            except OSError as e:
+                # Connected sockets report ICMP errors such as a refused port
+                self.drop_neighbor_socket(neighbor_id)
+                log.warning("Failed to send update to Server %s: %s", neighbor_id, e)
+                self.restore_pending(neighbor_id, delta)
+                continue
+            log.debug("Sent update to Server %s at %s:%s: %s bytes",
+                      neighbor_id, neighbor_info['ip'], neighbor_info['port'], len(payload))
+
+    def restore_pending(self, neighbor_id, delta):
+        """ Put back the routes of an update that did not reach a neighbor """
+        with self.lock:
+            self._pending[neighbor_id] |= delta
+
+    def create_update_message(self, routes, neighbor_id, indices=None):
+        """ Create a message to send a routing table snapshot to a neighbor """
+        costs, next_hops = routes
+        if indices is None:
+            indices = range(len(costs))
+        node_ids = self.node_ids
+        link_cost = self.neighbors[neighbor_id]['cost']
+        message = bytearray(UPDATE_HEADER.size + UPDATE_ENTRY.size * len(indices))
+        UPDATE_HEADER.pack_into(message, 0, 0, len(indices), self.port, self.packed_ip)
+        offset = UPDATE_HEADER.size
+        for i in indices:
+            dest_id, next_hop, cost = node_ids[i], next_hops[i], costs[i]
+            if dest_id == neighbor_id:
+                # The neighbor's own entry always carries our side of the link cost
+                next_hop, cost = neighbor_id, link_cost
+            elif next_hop == neighbor_id:
+                # Poisoned reverse
+                cost = INF
+            UPDATE_ENTRY.pack_into(message, offset, dest_id, next_hop, cost)
+            offset += UPDATE_ENTRY.size
         return message
 
-    def listen_for_updates(self):
+    def listen_for_updates(self, sock, cpu=None):
         """ Listen for incoming updates from other routers """
-        while self.running:
+        if cpu is not None:
+            # On Linux pid 0 means the calling thread, not the whole process
+            os.sched_setaffinity(0, {cpu})
+        selector = selectors.DefaultSelector()
+        sock.setblocking(False)
+        selector.register(sock, selectors.EVENT_READ)
+        # One receive buffer, reused for every datagram read by this thread
+        view = memoryview(bytearray(MAX_DATAGRAM_SIZE))
+        try:
+            while self.running:
+                # Wake up periodically so a cleared running flag is noticed
+                for key, _ in selector.select(timeout=1.0):
+                    self.drain_socket(key.fileobj, view)
+        finally:
+            selector.close()
+
+    def drain_socket(self, sock, view):
+        """ Read every datagram currently queued on a ready socket """
+        while True:
             try:
-                data, addr = self.sock.recvfrom(1024)
-                print(f"RECEIVED A MESSAGE FROM SERVER {addr}")
-                print(f"Message Content: {data.decode()}")
-                self.process_update_message(data.decode())
-                self.packet_counter += 1
+                nbytes, addr = sock.recvfrom_into(view)
+            except BlockingIOError:
+                return
             except socket.error as e:
-                if not self.running:
-                    break
-                print(f"Socket error: {e}")
+                if self.running:
+                    log.warning("Socket error: %s", e)
+                return
+            log.debug("Received %s bytes from %s:%s", nbytes, *addr)
+            # Shard by sender id so one neighbor's updates stay in order
+            sender_id = 0
+            if nbytes >= UPDATE_HEADER.size:
+                _, _, sender_port, packed_ip = UPDATE_HEADER.unpack_from(view)
+                sender_id = self.neighbor_by_addr.get((socket.inet_ntoa(packed_ip), sender_port), 0)
+            self.work_queues[sender_id % len(self.work_queues)].put(bytes(view[:nbytes]))
+            next(self._packet_count)
+
+    def process_messages(self, work_queue):
+        """ Apply received update messages taken from a work queue """
+        while self.running:
+            message = work_queue.get()
+            # One bad message must not stop the worker owning its sender
+            try:
+                self.process_update_message(message)
+            except Exception:
+                log.exception("Failed to process update of %s bytes", len(message))
 
     def process_update_message(self, message):
         """ Process incoming routing table updates """
-        print(f"Processing update message: {message}")
-        parts = message.split()
-        num_entries = int(parts[0])
-        sender_port = int(parts[1])
-        sender_ip = parts[2]
-
-        # Identify the sender ID from the neighbors list
-        sender_id = None
-        for neighbor_id, info in self.neighbors.items():
-            if info['ip'] == sender_ip and info['port'] == sender_port:
-                sender_id = neighbor_id
-                break
+        # Entries are unpacked only once the sender is known to be a neighbor
+        if len(message) < UPDATE_HEADER.size:
+            log.warning("Dropped truncated update of %s bytes", len(message))
+            return
+        sequence, num_entries, sender_port, packed_ip = UPDATE_HEADER.unpack_from(message)
+        sender_ip = socket.inet_ntoa(packed_ip)
+        if len(message) != UPDATE_HEADER.size + num_entries * UPDATE_ENTRY.size:
+            # A datagram arrives whole, so a length mismatch means it is malformed
+            log.warning("Dropped malformed update from %s:%s: %s entries in %s bytes",
+                        sender_ip, sender_port, num_entries, len(message))
+            return
 
+        # Identify the sender ID from its advertised address
+        sender_id = self.neighbor_by_addr.get((sender_ip, sender_port))
         if sender_id is None:
-            print(f"Received message from unknown server: {sender_ip}:{sender_port}")
+            log.warning("Received message from unknown server: %s:%s", sender_ip, sender_port)
             return
 
-        sender_cost = self.routing_table[sender_id]['cost']
-        updated = False
-
-        # Process each routing table entry in the received message
-        for i in range(num_entries):
-            idx = 3 + i * 3
-            dest_id = int(parts[idx])
-            next_hop = int(parts[idx + 1])
-            cost_from_sender = float(parts[idx + 2])
-
-            # Ignore the sender's self-route (e.g., "2 2 0.0" from Server 2)
-            if dest_id == sender_id:
-                continue
+        body = message[UPDATE_HEADER.size:]
+        with self.lock:
+            # Nothing is taken over a disabled link, not even liveness
+            if sender_id in self.disabled:
+                return
+            # Serial number arithmetic (RFC 1982), so the check survives wraparound
+            last = self.last_sequence.get(sender_id)
+            if last is not None and not 0 < (sequence - last) & 0xFFFFFFFF < 0x80000000:
+                log.debug("Dropped stale update %s from Server %s (last %s)", sequence, sender_id, last)
+                return
+            self.last_sequence[sender_id] = sequence
+            print(f"RECEIVED A MESSAGE FROM SERVER {sender_id}")
+            self.last_heard[sender_id] = time.monotonic()
+
+            vector = self.neighbor_vectors[sender_id]
+            link = self.neighbors[sender_id]
+            if link['cost'] == INF:
+                # A timed-out neighbor is back; resend it all routes
+                link['cost'] = self.link_costs[sender_id]
+                self._pending[sender_id].update(range(len(self.node_ids)))
+                self._dirty.set()
+            elif body == self.last_entries.get(sender_id):
+                # Unchanged resends cannot change any route
+                log.debug("Unchanged update from Server %s", sender_id)
+                return
+            self.last_entries[sender_id] = body
+
+            # Record the sender's advertised distance vector
+            server_id = self.server_id
+            index = self.index
+            for dest_id, next_hop, cost_from_sender in UPDATE_ENTRY.iter_unpack(body):
+                # Route to self (e.g., (1, 1, 6) from Server 2): the link cost, unless infinite
+                if dest_id == server_id:
+                    if next_hop == server_id and link['cost'] != INF and cost_from_sender != INF:
+                        link['cost'] = cost_from_sender
+                    continue
 
-            # Handle the route to self (e.g., "1 1 6" from Server 2)
-            if dest_id == self.server_id:
-                # Update the route to the sender with the received cost
-                if self.routing_table[sender_id]['cost'] != cost_from_sender:
-                    self.routing_table[sender_id] = {'next_hop': sender_id, 'cost': cost_from_sender}
-                    updated = True
-                continue
+                i = index.get(dest_id)
+                if i is not None:
+                    vector[i] = cost_from_sender
 
-            # Handle other routes using Bellman-Ford
-            new_cost = sender_cost + cost_from_sender
-            if dest_id not in self.routing_table or new_cost < self.routing_table[dest_id]['cost']:
-                self.routing_table[dest_id] = {'next_hop': sender_id, 'cost': new_cost}
-                updated = True
+            updated = self.recalculate_routes()
 
         # If the table was updated, propagate the changes
         if updated:
-            print(f"Updated routing table: {self.routing_table}")
-            self.send_update()
+            # routing_table builds a dict, so only pay for it when it is logged
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Updated routing table: %s", self.routing_table)
+            self._dirty.set()
         else:
-            print("No updates made to the routing table.")
+            log.debug("No updates made to the routing table.")
+
+    def recalculate_routes(self):
+        """ Rebuild and publish the routing table; caller holds the lock """
+        # D(dest) = min over neighbors v of c(self, v) + D_v(dest)
+        neighbors = self.neighbors
+        costs = [INF] * len(self.node_ids)
+        next_hops = list(self.node_ids)
+        costs[self.index[self.server_id]] = 0
+        for neighbor_id, vector in self.neighbor_vectors.items():
+            link_cost = neighbors[neighbor_id]['cost']
+            if link_cost == INF:
+                continue
+            for i, cost in enumerate(vector):
+                cost += link_cost
+                if cost < costs[i]:
+                    costs[i] = cost
+                    next_hops[i] = neighbor_id
+
+        old_costs, old_next_hops = self.routes
+        if len(old_costs) == len(costs):
+            self.apply_hold_down(costs, next_hops, old_costs, old_next_hops)
+
+        routes = (tuple(costs), tuple(next_hops))
+        if routes == self.routes:
+            return False
+        if len(old_costs) != len(costs):
+            self._changed.update(range(len(costs)))
+        else:
+            self._changed.update(i for i in range(len(costs))
+                                 if costs[i] != old_costs[i] or next_hops[i] != old_next_hops[i])
+        self.routes = routes
+        return True
+
+    def apply_hold_down(self, costs, next_hops, old_costs, old_next_hops):
+        """ Start, enforce and expire hold-downs on freshly computed routes """
+        now = time.monotonic()
+        hold_down = self.hold_down
+        neighbors = self.neighbors
+        node_ids = self.node_ids
+        for i, cost in enumerate(costs):
+            held = hold_down.get(i)
+            if held is None:
+                # Only a route lost with its next hop's link is held down
+                old_hop = neighbors.get(old_next_hops[i])
+                if cost <= old_costs[i] or old_hop is None or old_hop['cost'] != INF:
+                    continue
+                held = hold_down[i] = (now + HOLD_DOWN_INTERVALS * self.update_interval, old_costs[i])
+            elif held[0] <= now:
+                del hold_down[i]
+                continue
+            if cost > held[1]:
+                costs[i] = INF
+                next_hops[i] = node_ids[i]
+
+    @property
+    def routing_table(self):
+        """ Dict view of the current routes, for diagnostics """
+        costs, next_hops = self.routes
+        return {dest_id: {'next_hop': next_hop, 'cost': cost}
+                for dest_id, next_hop, cost in zip(self.node_ids, next_hops, costs)}
 
     def update_routing_table(self, neighbor_id, new_cost):
         """ Update link cost to a neighbor and adjust routing table """
-        if neighbor_id in self.neighbors:
-            self.neighbors[neighbor_id]['cost'] = new_cost
-            self.routing_table[neighbor_id] = {'next_hop': neighbor_id, 'cost': new_cost}
+        if not 0 <= new_cost < INF:
+            print(f"update {self.server_id} {neighbor_id} FAILED: Cost must be 0-{INF - 1}")
+        elif neighbor_id in self.neighbors:
+            with self.lock:
+                self.neighbors[neighbor_id]['cost'] = new_cost
+                self.link_costs[neighbor_id] = new_cost
+                if neighbor_id in self.disabled:
+                    # Re-enabled; resend all routes
+                    self.disabled.discard(neighbor_id)
+                    self._pending[neighbor_id].update(range(len(self.node_ids)))
+                # Apply the neighbor's next update in full again
+                self.last_entries.pop(neighbor_id, None)
+                # Tell the neighbor the new cost even if no route changes
+                self._pending[neighbor_id].add(self.index[neighbor_id])
+                self._dirty.set()
+                self.recalculate_routes()
             print(f"Updated neighbor {neighbor_id} cost to {new_cost}")
-            print(f"Updated routing table: {self.routing_table}")
-            # Propagate changes immediately
-            self.send_update()
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Updated routing table: %s", self.routing_table)
         else:
             print(f"update {self.server_id} {neighbor_id} FAILED: Not a neighbor")
 
@@ -158,37 +466,78 @@ class Router:
 
     def packets(self):
         """ Display and reset the number of received packets """
-        print(f"packets: {self.packet_counter}")
-        self.packet_counter = 0
+        # Reading consumes one value of the count, so skip past it
+        current = next(self._packet_count)
+        print(f"packets: {current - self._packets_base}")
+        self._packets_base = current + 1
 
     def display(self):
         """ Display the current routing table """
-        print("Routing Table:")
-        for dest_id in sorted(self.routing_table.keys()):
-            route = self.routing_table[dest_id]
-            print(f"{dest_id} {route['next_hop']} {route['cost']}")
-        print("display SUCCESS")
+        costs, next_hops = self.routes
+        # Printed in one write so other output cannot interleave
+        rows = [f"{dest_id} {next_hop} {'inf' if cost == INF else cost}"
+                for dest_id, next_hop, cost in zip(self.node_ids, next_hops, costs)]
+        print("\n".join(["Routing Table:", *rows, "display SUCCESS"]))
 
     def disable(self, neighbor_id):
         """ Disable the link to a given neighbor """
         if neighbor_id in self.neighbors:
-            self.neighbors[neighbor_id]['cost'] = float('inf')
-            self.routing_table[neighbor_id]['cost'] = float('inf')
+            with self.lock:
+                self.neighbors[neighbor_id]['cost'] = INF
+                self.disabled.add(neighbor_id)
+                if self.recalculate_routes():
+                    self._dirty.set()
             print(f"disable {neighbor_id} SUCCESS")
         else:
             print(f"disable {neighbor_id} FAILED: Not a neighbor")
 
     def crash(self):
         """ Simulate a server crash by disabling all connections """
+        # Disabled links are not sent to; the timer keeps running for re-enables
         for neighbor_id in self.neighbors:
             self.disable(neighbor_id)
         print("crash SUCCESS")
 
+    def stop_updates(self):
+        """ Stop the periodic and triggered update timer """
+        self._stop.set()
+        # The timer thread waits on the dirty event; wake it to notice the stop
+        self._dirty.set()
+
     def run_periodic_updates(self):
-        """ Periodically send routing updates """
-        while self.running:
-            time.sleep(self.update_interval)
-            self.send_update()
+        """ Send periodic updates, flushing triggered ones in between """
+        next_tick = time.monotonic() + self.update_interval
+        ticks = 0
+        while not self._stop.is_set():
+            timeout = next_tick - time.monotonic()
+            if timeout <= 0:
+                self.check_neighbors()
+                ticks += 1
+                self.send_update(full=ticks % FULL_UPDATE_EVERY == 0, heartbeat=True)
+                next_tick = time.monotonic() + self.update_interval
+            elif self._dirty.wait(timeout=timeout) and not self._stop.is_set():
+                # Coalesce a burst of changes into one update
+                time.sleep(MIN_FLUSH_INTERVAL)
+                self._dirty.clear()
+                self.send_update(full=False)
+
+    def check_neighbors(self):
+        """ Set the link cost of neighbors that stopped sending updates to infinity """
+        # Passive: no probe is sent or waited for
+        deadline = time.monotonic() - NEIGHBOR_TIMEOUT_INTERVALS * self.update_interval
+        with self.lock:
+            timed_out = [neighbor_id for neighbor_id, heard in self.last_heard.items()
+                         if heard < deadline and self.neighbors[neighbor_id]['cost'] != INF]
+            for neighbor_id in timed_out:
+                log.warning("No update from Server %s in %s intervals; link cost set to infinity",
+                            neighbor_id, NEIGHBOR_TIMEOUT_INTERVALS)
+                self.neighbors[neighbor_id]['cost'] = INF
+                # Whatever the neighbor sends when it returns starts a new run
+                self.last_sequence.pop(neighbor_id, None)
+                self.last_entries.pop(neighbor_id, None)
+            # A recalculation also releases routes whose hold-down expired
+            if timed_out or self.hold_down:
+                self.recalculate_routes()
 
     def handle_commands(self):
         """ Continuously read user commands from the terminal """
@@ -213,30 +562,72 @@ class Router:
                     self.crash()
                 elif cmd == "exit":
                     self.running = False
+                    self.stop_updates()
                 else:
                     print("Invalid command")
         except KeyboardInterrupt:
             print("\nCTRL+C pressed. Exiting program...")
             self.running = False
+            self.stop_updates()
+
+    def start(self):
+        """ Start the background listener and update threads """
+        # Keep each listener on one core so its socket buffers stay cache-hot
+        cpus = [None]
+        if self.pin_cpus and hasattr(os, 'sched_setaffinity'):
+            cpus = sorted(os.sched_getaffinity(0))
+        for i, sock in enumerate(self.sockets):
+            cpu = cpus[i % len(cpus)]
+            threading.Thread(target=self.listen_for_updates, args=(sock, cpu), daemon=True).start()
+        for work_queue in self.work_queues:
+            threading.Thread(target=self.process_messages, args=(work_queue,), daemon=True).start()
+        threading.Thread(target=self.run_periodic_updates, daemon=True).start()
 
     def run(self):
         """ Start server """
-        threading.Thread(target=self.listen_for_updates, daemon=True).start()
-        threading.Thread(target=self.run_periodic_updates, daemon=True).start()
+        self.start()
         self.handle_commands()
 
 
 def main():
-    if len(sys.argv) != 4:
-        print("Usage: python3 RouterServer.py <server-ID> <routing-update-interval> <topology-file>")
-        sys.exit(1)
-
-    server_id = int(sys.argv[1])
-    update_interval = int(sys.argv[2])
-    topology_file = sys.argv[3]
-
-    router = Router(server_id, update_interval, topology_file)
-    router.run()
+    parser = argparse.ArgumentParser(description="Distance vector router")
+    parser.add_argument('server_id', type=int, metavar='server-ID')
+    parser.add_argument('update_interval', type=int, metavar='routing-update-interval')
+    parser.add_argument('topology_file', metavar='topology-file')
+    parser.add_argument('--listeners', type=int, default=1, metavar='N',
+                        help="sockets sharing the port through SO_REUSEPORT (default: 1)")
+    parser.add_argument('--pin-cpus', action='store_true',
+                        help="pin each listener thread to its own CPU core")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, metavar='N',
+                        help="threads applying received updates (default: CPU count)")
+    args = parser.parse_args()
+    if args.listeners < 1:
+        parser.error("--listeners must be at least 1")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    # Records are written to stderr by a background thread
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    log_listener = logging.handlers.QueueListener(log_queue, handler)
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.INFO)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    log_listener.start()
+
+    try:
+        router = Router(args.server_id, args.update_interval, args.topology_file,
+                        listeners=args.listeners, pin_cpus=args.pin_cpus,
+                        workers=args.workers)
+    except ValueError as e:
+        log_listener.stop()
+        parser.exit(1, f"Invalid topology file {args.topology_file}: {e}\n")
+    try:
+        router.run()
+    finally:
+        # Flush queued records before the interpreter exits
+        log_listener.stop()
 
 
 if __name__ == "__main__":